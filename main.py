@@ -4,66 +4,335 @@ Aplikasi Web Konverter PDF (c) 2024
 Versi: 6.0 (Merge, Split, & Smart Compression with Target Size)
 """
 import os
+import re
+import heapq
+import hashlib
 import shutil
 import logging
 import tempfile
 import io
 from typing import List, Optional
+from functools import partial
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
 from enum import Enum
-from zipfile import ZipFile
+from zipfile import ZipFile, ZIP_DEFLATED, ZIP_STORED
+from xml.sax.saxutils import escape as xml_escape
 
 # Framework
 from fastapi import FastAPI, File, UploadFile, HTTPException, BackgroundTasks, Form
-from fastapi.responses import FileResponse
+from fastapi.responses import FileResponse, ORJSONResponse
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.middleware.gzip import GZipMiddleware
+from fastapi.concurrency import run_in_threadpool
 
 # Library Konversi
 from pdf2docx import Converter
 import fitz  # PyMuPDF
 from pptx import Presentation
-from pptx.util import Inches, Pt
+from pptx.util import Pt
 from pptx.dml.color import RGBColor
 from pptx.enum.text import MSO_ANCHOR, MSO_AUTO_SIZE
 import pdfplumber
-import pandas as pd
+import numpy as np
+from openpyxl import Workbook
+from openpyxl.cell import WriteOnlyCell
 from openpyxl.styles import Border, Side, Alignment, Font, PatternFill
 from openpyxl.utils import get_column_letter
 
 # Konfigurasi Ukuran File (25MB)
-MAX_FILE_SIZE = 25 * 1024 * 1024 
+MAX_FILE_SIZE = 25 * 1024 * 1024
+
+# 1 point PDF = 12700 EMU; dipakai langsung sebagai int agar tidak membuat
+# objek Emu/Inches baru untuk setiap shape PPT
+EMU_PER_POINT = 914400 // 72
+
+# Jumlah worker pdf2docx; set PDF2DOCX_WORKERS=1 di server kecil (mis. free tier)
+# untuk mematikan fork per halaman
+PDF2DOCX_WORKERS = int(os.environ.get("PDF2DOCX_WORKERS", min(os.cpu_count() or 1, 4)))
+
+# Folder kerja diarahkan ke tmpfs (/dev/shm) bila tersedia supaya file
+# intermediate (input PDF + hasil konversi) tidak pernah menyentuh disk;
+# bisa dioverride lewat env PDF_TMP_ROOT, fallback ke /tmp biasa
+# Docker default hanya memberi /dev/shm 64MB (tanpa --shm-size); tmpfs sekecil
+# itu langsung ENOSPC oleh satu request pdf-to-image, jadi tmpfs hanya dipakai
+# bila ruang kosongnya minimal sebesar ini
+TMP_MIN_FREE_BYTES = 256 * 1024 * 1024
+
+TMP_ROOT = os.environ.get("PDF_TMP_ROOT", "/dev/shm/pdfapi")
+try:
+    os.makedirs(TMP_ROOT, exist_ok=True)
+    vfs = os.statvfs(TMP_ROOT)
+    if vfs.f_frsize * vfs.f_bavail < TMP_MIN_FREE_BYTES:
+        TMP_ROOT = None
+except OSError:
+    TMP_ROOT = None
+
+# Setting deteksi tabel pdfplumber (strategi 'lines' jauh lebih cepat dari default)
+TABLE_SETTINGS = {
+    'vertical_strategy': 'lines',
+    'horizontal_strategy': 'lines',
+    'snap_tolerance': 3,
+    'intersection_tolerance': 3,
+}
+
+# Satu token range halaman: "5" atau "5-10" (dengan spasi opsional)
+_PAGE_RANGE_RE = re.compile(r'\s*(\d+)(?:\s*-\s*(\d+))?\s*$')
+
+# Di atas jumlah baris ini, hasil Excel ditulis langsung sebagai XML (tanpa style)
+FAST_XLSX_ROW_THRESHOLD = 50000
+
+# Karakter kontrol yang tidak sah di XML 1.0 (mis. \x0b/\x0c dari teks hasil
+# ekstraksi PDF); xml_escape tidak membuangnya dan Excel menolak file berisi ini
+_XML_ILLEGAL_RE = re.compile(r'[\x00-\x08\x0b\x0c\x0e-\x1f]')
+
+# Style openpyxl immutable -> cukup dibuat sekali dan dibagikan antar cell,
+# bukan dialokasikan ulang di dalam loop penulisan
+THIN_BORDER = Border(left=Side(style='thin'), right=Side(style='thin'), top=Side(style='thin'), bottom=Side(style='thin'))
+HEADER_FONT = Font(bold=True)
+HEADER_FILL = PatternFill(start_color='D3D3D3', end_color='D3D3D3', fill_type='solid')
+ALIGN_HEADER = Alignment(horizontal='center', vertical='center', wrap_text=True)
+ALIGN_BODY = Alignment(vertical='top', wrap_text=True)
 
 app = FastAPI(
     title="Aplikasi Konverter PDF",
     description="API untuk mengubah format file dari PDF ke format lainnya.",
     version="6.0",
+    # orjson menserialisasi response JSON (error detail dll.) di C, bukan json.dumps
+    default_response_class=ORJSONResponse,
 )
 
-# === KONFIGURASI CORS ===
+# === KONFIGURASI MIDDLEWARE ===
+# Kompres response JSON (error detail, health check) di wire; file hasil konversi
+# sudah berformat zip/deflate sehingga ditandai identity di file_response
+app.add_middleware(GZipMiddleware, minimum_size=1024)
+
+# CORS: wildcard origin + credentials adalah kombinasi yang ditolak browser,
+# jadi credentials tidak diaktifkan (API ini juga tidak memakai cookie)
 app.add_middleware(
     CORSMiddleware,
     allow_origins=["*"],
-    allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
 )
 
+# Cache hasil konversi antar request, di-key hash SHA-256 input (+ parameter).
+# Upload ulang dokumen yang sama (umum saat user mencoba beberapa format)
+# langsung dilayani dari sini tanpa konversi ulang
+RESULT_CACHE_DIR = os.path.join(TMP_ROOT or tempfile.gettempdir(), "pdfapi_result_cache")
+os.makedirs(RESULT_CACHE_DIR, exist_ok=True)
+
+# Batas total ukuran cache hasil; entry paling lama tidak tersentuh dibuang dulu.
+# Default 512MB dipangkas ke setengah kapasitas filesystem tempat cache berada,
+# supaya cache di tmpfs kecil (mis. /dev/shm 64MB docker) tidak memonopoli ruang
+_cache_vfs = os.statvfs(RESULT_CACHE_DIR)
+RESULT_CACHE_MAX_BYTES = min(
+    int(os.environ.get("RESULT_CACHE_MAX_MB", "512")) * 1024 * 1024,
+    _cache_vfs.f_frsize * _cache_vfs.f_blocks // 2,
+)
+
 # --- HELPER FUNCTIONS ---
-def cleanup_folder(path: str):
+def make_tmp_dir() -> str:
+    return tempfile.mkdtemp(dir=TMP_ROOT)
+
+def cache_get(key: str, dst_dir: str):
+    """Salin hasil konversi di cache ke dst_dir, atau None bila miss.
+
+    Hit tidak dilayani langsung dari folder cache: _evict_result_cache() dari
+    request lain bisa meng-unlink entry sebelum FileResponse selesai streaming.
+    Hard link ke tmp_dir request (fallback copy) bebas dari race itu.
+    """
+    path = os.path.join(RESULT_CACHE_DIR, key)
+    local = os.path.join(dst_dir, key)
     try:
-        if os.path.exists(path):
-            shutil.rmtree(path)
-            logging.info(f"Deleted temp folder: {path}")
-    except Exception as e:
-        logging.error(f"Error cleaning up: {e}")
+        os.link(path, local)
+    except OSError:
+        try:
+            shutil.copyfile(path, local)
+        except OSError:
+            return None
+    os.utime(path)  # tandai baru dipakai
+    return local
+
+def cache_put(key: str, src_path: str):
+    # Copy ke nama sementara dulu lalu rename atomik, supaya request paralel
+    # tidak pernah membaca entry cache yang baru setengah tertulis
+    path = os.path.join(RESULT_CACHE_DIR, key)
+    tmp = f"{path}.{os.getpid()}.tmp"
+    try:
+        shutil.copyfile(src_path, tmp)
+        os.replace(tmp, path)
+        _evict_result_cache()
+    except OSError:
+        pass  # cache bersifat best-effort, konversi tetap sukses
+
+def _evict_result_cache():
+    # Jaga total ukuran cache di bawah batas: urutkan by mtime (di-refresh
+    # cache_get lewat utime) dan buang yang paling lama tidak dipakai
+    entries = []
+    total = 0
+    with os.scandir(RESULT_CACHE_DIR) as it:
+        for entry in it:
+            try:
+                st = entry.stat()
+            except OSError:
+                continue
+            entries.append((st.st_mtime, st.st_size, entry.path))
+            total += st.st_size
+    if total <= RESULT_CACHE_MAX_BYTES:
+        return
+    for _mtime, size, path in sorted(entries):
+        try:
+            os.remove(path)
+        except OSError:
+            continue
+        total -= size
+        if total <= RESULT_CACHE_MAX_BYTES:
+            break
+
+def cleanup_folder(path: str):
+    # Background task sinkron dijalankan Starlette di threadpool, jadi rmtree
+    # folder besar (ratusan gambar) tidak memblokir event loop maupun request lain
+    shutil.rmtree(path, ignore_errors=True)
+    logging.info("Deleted temp folder: %s", path)
+
+def file_response(path: str, filename: str, media_type: str) -> FileResponse:
+    # stat_result diberikan di depan agar Starlette langsung pakai sendfile() (zero-copy).
+    # Content-Encoding: identity mencegah GZipMiddleware mengkompres ulang file yang
+    # sudah terkompres (docx/xlsx/pptx/zip/pdf) dan mematikan jalur sendfile-nya
+    return FileResponse(path=path, filename=filename, media_type=media_type,
+                        stat_result=os.stat(path), headers={"Content-Encoding": "identity"})
+
+def cluster_words_into_lines(words, tolerance=3):
+    """Kelompokkan kata menjadi baris berdasarkan posisi vertikal (top). Hasil terurut by top.
+
+    Pengelompokan dan reduksi bbox dikerjakan di NumPy (argsort + diff + reduceat);
+    kerja di level Python tinggal join teks per baris.
+    """
+    if not words:
+        return []
+    arr = np.asarray([(w['x0'], w['top'], w['x1'], w['bottom']) for w in words], dtype=np.float64)
+    texts = np.asarray([w['text'] for w in words], dtype=object)
+
+    order = np.argsort(arr[:, 1], kind='stable')
+    arr = arr[order]; texts = texts[order]
+
+    # Baris baru dimulai saat selisih 'top' dengan kata sebelumnya >= tolerance
+    new_line = np.concatenate(([True], np.diff(arr[:, 1]) >= tolerance))
+    starts = np.flatnonzero(new_line)
+
+    x0 = np.minimum.reduceat(arr[:, 0], starts)
+    top = np.minimum.reduceat(arr[:, 1], starts)
+    x1 = np.maximum.reduceat(arr[:, 2], starts)
+    bottom = np.maximum.reduceat(arr[:, 3], starts)
+
+    # Urutkan kata di dalam tiap baris berdasarkan x0, lalu gabungkan teksnya
+    group_id = np.cumsum(new_line) - 1
+    texts = texts[np.lexsort((arr[:, 0], group_id))]
+
+    bounds = np.append(starts, len(arr))
+    return [
+        {'text': " ".join(texts[bounds[i]:bounds[i+1]]),
+         'top': top[i], 'x0': x0[i], 'x1': x1[i], 'bottom': bottom[i]}
+        for i in range(len(starts))
+    ]
+
+def _words_outside_tables_grid(words, table_bboxes, page_width, page_height):
+    """Klasifikasi kata di luar tabel memakai grid spasial 32x32.
+
+    Untuk halaman dengan banyak tabel, broadcast penuh kata x tabel tetap
+    menguji semua pasangan; dengan grid, tiap kata hanya diuji terhadap bbox
+    yang menyentuh sel grid-nya (mayoritas sel kosong).
+    """
+    cell_w = page_width / 32
+    cell_h = page_height / 32
+    grid = {}
+    for bbox in table_bboxes:
+        for gx in range(int(bbox[0] // cell_w), int(bbox[2] // cell_w) + 1):
+            for gy in range(int(bbox[1] // cell_h), int(bbox[3] // cell_h) + 1):
+                grid.setdefault((gx, gy), []).append(bbox)
+
+    outside = []
+    for w in words:
+        mx = (w['x0'] + w['x1']) * 0.5
+        my = (w['top'] + w['bottom']) * 0.5
+        cands = grid.get((int(mx // cell_w), int(my // cell_h)))
+        if not cands or not any(b[0] <= mx <= b[2] and b[1] <= my <= b[3] for b in cands):
+            outside.append(w)
+    return outside
+
+_XLSX_CONTENT_TYPES = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+    '<Types xmlns="http://schemas.openxmlformats.org/package/2006/content-types">'
+    '<Default Extension="rels" ContentType="application/vnd.openxmlformats-package.relationships+xml"/>'
+    '<Default Extension="xml" ContentType="application/xml"/>'
+    '<Override PartName="/xl/workbook.xml" ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet.main+xml"/>'
+    '<Override PartName="/xl/worksheets/sheet1.xml" ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.worksheet+xml"/>'
+    '</Types>'
+)
+_XLSX_RELS = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+    '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+    '<Relationship Id="rId1" Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/officeDocument" Target="xl/workbook.xml"/>'
+    '</Relationships>'
+)
+_XLSX_WORKBOOK = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+    '<workbook xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main" '
+    'xmlns:r="http://schemas.openxmlformats.org/officeDocument/2006/relationships">'
+    '<sheets><sheet name="Hasil Konversi" sheetId="1" r:id="rId1"/></sheets></workbook>'
+)
+_XLSX_WORKBOOK_RELS = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+    '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+    '<Relationship Id="rId1" Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/worksheet" Target="worksheets/sheet1.xml"/>'
+    '</Relationships>'
+)
+
+def _write_xlsx_fast(rows, path):
+    """Fast path untuk sheet yang sangat besar: tulis sheet1.xml langsung (inline string,
+    tanpa style/border) ke dalam kerangka zip XLSX. Jauh lebih cepat dari openpyxl
+    karena tidak ada objek Cell per nilai."""
+    buf = io.StringIO()
+    buf.write('<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+              '<worksheet xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main"><sheetData>')
+    for r_idx, row in enumerate(rows, 1):
+        buf.write(f'<row r="{r_idx}">')
+        for c_idx, val in enumerate(row, 1):
+            if val is None or val == '':
+                continue
+            text = xml_escape(_XML_ILLEGAL_RE.sub(' ', str(val)))
+            buf.write(f'<c r="{get_column_letter(c_idx)}{r_idx}" t="inlineStr"><is><t>{text}</t></is></c>')
+        buf.write('</row>')
+    buf.write('</sheetData></worksheet>')
+    with ZipFile(path, 'w', ZIP_DEFLATED) as z:
+        z.writestr('[Content_Types].xml', _XLSX_CONTENT_TYPES)
+        z.writestr('_rels/.rels', _XLSX_RELS)
+        z.writestr('xl/workbook.xml', _XLSX_WORKBOOK)
+        z.writestr('xl/_rels/workbook.xml.rels', _XLSX_WORKBOOK_RELS)
+        z.writestr('xl/worksheets/sheet1.xml', buf.getvalue())
+
+async def read_upload(file: UploadFile) -> bytes:
+    # Baca body upload per-chunk agar event loop tidak terblokir.
+    # Ukuran dicek sambil jalan: upload oversize ditolak begitu batas terlewati,
+    # tanpa menunggu (apalagi mem-buffer) sisa body-nya
+    chunks = []
+    size = 0
+    while chunk := await file.read(1 << 20):
+        size += len(chunk)
+        if size > MAX_FILE_SIZE:
+            raise HTTPException(status_code=413, detail=f"Ukuran file terlalu besar (Maks {MAX_FILE_SIZE/1024/1024}MB)")
+        chunks.append(chunk)
+    return b"".join(chunks)
 
 def validate_file(file: UploadFile):
+    # Hanya cek metadata; ukuran sebenarnya tetap divalidasi saat body dibaca
+    # (read_upload), jadi tidak perlu seek ke akhir spool file
     if not file.filename.lower().endswith(".pdf"):
         raise HTTPException(status_code=400, detail="File harus format PDF")
-    file.file.seek(0, 2)
-    file_size = file.file.tell()
-    file.file.seek(0)
-    if file_size > MAX_FILE_SIZE:
-        raise HTTPException(status_code=400, detail=f"Ukuran file terlalu besar (Maks {MAX_FILE_SIZE/1024/1024}MB)")
+    # Starlette mengisi file.size dari part multipart bila tersedia ->
+    # upload yang jelas oversize ditolak sebelum satu chunk pun dibaca
+    if file.size and file.size > MAX_FILE_SIZE:
+        raise HTTPException(status_code=413, detail=f"Ukuran file terlalu besar (Maks {MAX_FILE_SIZE/1024/1024}MB)")
 
 @app.get("/")
 def read_root():
@@ -74,174 +343,423 @@ def read_root():
 # ==========================================
 
 # ... [FITUR PDF TO DOCX] ...
+def _do_convert_docx(pdf_path: str, docx_path: str):
+    with fitz.open(pdf_path) as probe:
+        page_count = len(probe)
+        # PDF prosa murni (tanpa garis/kotak vektor) tidak mungkin punya tabel
+        # bergaris; matikan detektor tabel pdf2docx supaya halaman teks tidak
+        # membayar parsing tabel yang pasti nihil
+        has_drawings = any(page.get_cdrawings() for page in probe)
+    kwargs = {} if has_drawings else {'parse_lattice_table': False, 'parse_stream_table': False}
+    cv = Converter(pdf_path)
+    if page_count > 1 and PDF2DOCX_WORKERS > 1:
+        # Biarkan pdf2docx mem-fork worker per halaman; untuk dokumen
+        # satu halaman (atau server single-core) overhead fork-nya tidak sepadan
+        cv.convert(docx_path, start=0, end=None, multi_processing=True, cpu_count=PDF2DOCX_WORKERS, ignore_page_error=True, **kwargs)
+    else:
+        cv.convert(docx_path, start=0, end=None, multi_processing=False, ignore_page_error=True, **kwargs)
+    cv.close()
+
 @app.post("/convert/pdf-to-docx")
-def convert_pdf_to_docx(background_tasks: BackgroundTasks, file: UploadFile = File(...)):
+async def convert_pdf_to_docx(background_tasks: BackgroundTasks, file: UploadFile = File(...)):
     validate_file(file)
-    tmp_dir = tempfile.mkdtemp()
+    tmp_dir = make_tmp_dir()
     tmp_pdf_path = os.path.join(tmp_dir, file.filename)
     docx_filename = os.path.splitext(file.filename)[0] + ".docx"
     tmp_docx_path = os.path.join(tmp_dir, docx_filename)
     try:
+        size = 0
+        digest = hashlib.sha256()
         with open(tmp_pdf_path, "wb") as buffer:
-            shutil.copyfileobj(file.file, buffer)
-        cv = Converter(tmp_pdf_path)
-        cv.convert(tmp_docx_path, start=0, end=None, multiprocess=False)
-        cv.close()
+            # Tulis upload per-chunk tanpa memblokir event loop; ukuran dicek
+            # di tengah copy agar upload oversize berhenti di batas, bukan di akhir
+            while chunk := await file.read(1 << 20):
+                size += len(chunk)
+                if size > MAX_FILE_SIZE:
+                    raise HTTPException(status_code=413, detail=f"Ukuran file terlalu besar (Maks {MAX_FILE_SIZE/1024/1024}MB)")
+                digest.update(chunk)
+                buffer.write(chunk)
+        cache_key = f"{digest.hexdigest()}.docx"
+        cached = cache_get(cache_key, tmp_dir)
+        if cached:
+            background_tasks.add_task(cleanup_folder, tmp_dir)
+            return file_response(cached, docx_filename, 'application/vnd.openxmlformats-officedocument.wordprocessingml.document')
+        # Konversi berat dijalankan di threadpool agar request lain tetap terlayani
+        await run_in_threadpool(_do_convert_docx, tmp_pdf_path, tmp_docx_path)
+        cache_put(cache_key, tmp_docx_path)
         background_tasks.add_task(cleanup_folder, tmp_dir)
-        return FileResponse(path=tmp_docx_path, filename=docx_filename, media_type='application/vnd.openxmlformats-officedocument.wordprocessingml.document')
+        return file_response(tmp_docx_path, docx_filename, 'application/vnd.openxmlformats-officedocument.wordprocessingml.document')
+    except HTTPException:
+        # Error client (413/400) diteruskan apa adanya, jangan dibungkus jadi 500
+        cleanup_folder(tmp_dir)
+        raise
     except Exception as e:
         cleanup_folder(tmp_dir)
         raise HTTPException(status_code=500, detail=f"Gagal convert Word: {str(e)}")
 
 # ... [FITUR PDF TO EXCEL] ...
+# Dokumen pdfplumber di-cache per worker proses (dibuka sekali lewat initializer)
+_worker_pdf = None
+
+def _open_worker_pdf(pdf_path: str):
+    global _worker_pdf
+    _worker_pdf = pdfplumber.open(pdf_path)
+
+def _extract_page_plan(page_idx: int):
+    """Worker pool proses: parse satu halaman menjadi rencana baris picklable.
+
+    Mengembalikan (rows, table_rows, header_rows) dengan index relatif terhadap
+    awal halaman; penggabungan antar halaman dilakukan berurutan di proses utama.
+    """
+    page = _worker_pdf.pages[page_idx]
+
+    # Halaman tanpa garis/kotak pasti tidak punya tabel 'lines' -> skip deteksi
+    if not page.lines and not page.rects:
+        tables = []
+    else:
+        tables = page.find_tables(table_settings=TABLE_SETTINGS)
+    table_bboxes = [t.bbox for t in tables]
+    # Toleransi ketat, sejalan dengan tolerance=3 di cluster_words_into_lines;
+    # menghindari kerja clustering ekstra bawaan pdfplumber
+    words = page.extract_words(x_tolerance=1.5, y_tolerance=3, use_text_flow=False)
+    if not table_bboxes or not words:
+        # Tidak ada tabel (kasus paling umum) -> semua kata dipakai, skip klasifikasi
+        non_table_words = words
+    elif len(table_bboxes) > 4:
+        # Banyak tabel kecil: grid spasial lebih murah dari broadcast penuh
+        non_table_words = _words_outside_tables_grid(words, table_bboxes, page.width, page.height)
+    else:
+        # Klasifikasi semua kata vs semua tabel sekaligus (vectorized, bukan loop Python)
+        W = np.asarray([(w['x0'], w['top'], w['x1'], w['bottom']) for w in words], dtype=np.float32)
+        T = np.asarray(table_bboxes, dtype=np.float32)
+        mx = (W[:, 0] + W[:, 2]) * 0.5
+        my = (W[:, 1] + W[:, 3]) * 0.5
+        inside = ((mx[:, None] >= T[None, :, 0]) & (mx[:, None] <= T[None, :, 2]) &
+                  (my[:, None] >= T[None, :, 1]) & (my[:, None] <= T[None, :, 3])).any(axis=1)
+        non_table_words = [w for w, ins in zip(words, inside) if not ins]
+    text_lines = cluster_words_into_lines(non_table_words)
+
+    # Tabel (terurut by y dari find_tables) dan baris teks (terurut by top)
+    # digabung dengan heapq.merge -> O(N), tanpa sort ulang, urutan baca terjaga
+    page_elements = heapq.merge(
+        ((t.bbox[1], 'table', t) for t in tables),
+        ((l['top'], 'text', l) for l in text_lines),
+        key=lambda e: e[0],
+    )
+
+    rows = []
+    table_rows = []
+    header_rows = []
+    for _top, kind, obj in page_elements:
+        if kind == 'text':
+            rows.append([obj['text']])
+        else:
+            data = obj.extract()
+            if data:
+                header_rows.append(len(rows))
+                for r in data:
+                    table_rows.append(len(rows))
+                    rows.append(list(r))
+            rows.append([])
+    rows.append([]); rows.append([])
+    return rows, table_rows, header_rows
+
 @app.post("/convert/pdf-to-excel")
-def convert_pdf_to_excel(background_tasks: BackgroundTasks, file: UploadFile = File(...)):
+async def convert_pdf_to_excel(background_tasks: BackgroundTasks, file: UploadFile = File(...)):
     validate_file(file)
-    tmp_dir = tempfile.mkdtemp()
-    tmp_pdf_path = os.path.join(tmp_dir, file.filename)
+    tmp_dir = make_tmp_dir()
     xlsx_filename = os.path.splitext(file.filename)[0] + ".xlsx"
     tmp_xlsx_path = os.path.join(tmp_dir, xlsx_filename)
     try:
-        with open(tmp_pdf_path, "wb") as buffer:
-            shutil.copyfileobj(file.file, buffer)
-        with pd.ExcelWriter(tmp_xlsx_path, engine='openpyxl') as writer:
-            with pdfplumber.open(tmp_pdf_path) as pdf:
-                writer.book.create_sheet("Hasil Konversi")
-                worksheet = writer.book["Hasil Konversi"]
-                if "Sheet" in writer.book.sheetnames: del writer.book["Sheet"]
-                current_row = 1
-                thin_border = Border(left=Side(style='thin'), right=Side(style='thin'), top=Side(style='thin'), bottom=Side(style='thin'))
-                
-                # Helper internal untuk excel
-                def is_inside(bbox, tables):
-                    mx, my = (bbox[0]+bbox[2])/2, (bbox[1]+bbox[3])/2
-                    for t in tables:
-                        if t[0]<=mx<=t[2] and t[1]<=my<=t[3]: return True
-                    return False
-                
-                for page in pdf.pages:
-                    tables = page.find_tables()
-                    table_bboxes = [t.bbox for t in tables]
-                    words = page.extract_words()
-                    non_table_words = [w for w in words if not is_inside((w['x0'],w['top'],w['x1'],w['bottom']), table_bboxes)]
-                    
-                    # Simple text clustering (simplified for brevity in this merged version)
-                    non_table_text = []
-                    if non_table_words:
-                         non_table_text = sorted(non_table_words, key=lambda x: x['top'])
-                    
-                    # Write simple text
-                    for w in non_table_text:
-                        worksheet.cell(row=current_row, column=1, value=w['text'])
-                        current_row += 1
-                    
-                    # Write tables
-                    for t in tables:
-                        data = t.extract()
-                        if data:
-                            df = pd.DataFrame(data)
-                            for r in dataframe_to_rows(df, index=False, header=False):
-                                for c_idx, val in enumerate(r, 1):
-                                    c = worksheet.cell(row=current_row, column=c_idx, value=val)
-                                    c.border = thin_border
-                                current_row += 1
-                        current_row += 1
-                    current_row += 2
-        
+        # Upload sudah dibatasi MAX_FILE_SIZE -> aman ditahan di memori,
+        # tidak perlu tulis-baca ulang lewat file sementara
+        pdf_bytes = await read_upload(file)
+
+        cache_key = f"{hashlib.sha256(pdf_bytes).hexdigest()}.xlsx"
+        cached = cache_get(cache_key, tmp_dir)
+        if cached:
+            background_tasks.add_task(cleanup_folder, tmp_dir)
+            return file_response(cached, xlsx_filename, 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet')
+
+        def _convert():
+            # --- FASE 1: PARSE PDF -> daftar baris (paralel per halaman) ---
+            # Worker membuka ulang dari path lewat initializer pool
+            tmp_input = os.path.join(tmp_dir, "input.pdf")
+            with open(tmp_input, "wb") as f:
+                f.write(pdf_bytes)
+            with fitz.open(tmp_input) as probe:
+                page_count = probe.page_count
+
+            rows = []           # nilai per baris (list of list)
+            table_rows = set()  # index baris (0-based) yang berasal dari tabel -> diberi border
+            header_rows = set() # baris pertama tiap tabel -> diberi style header
+
+            workers = min(os.cpu_count() or 1, 4)
+            with ProcessPoolExecutor(max_workers=workers,
+                                     initializer=_open_worker_pdf, initargs=(tmp_input,)) as ex:
+                # ex.map menjaga urutan halaman; hasil di-stream ke daftar global
+                for p_rows, p_tables, p_headers in ex.map(_extract_page_plan, range(page_count)):
+                    base = len(rows)
+                    table_rows.update(base + i for i in p_tables)
+                    header_rows.update(base + i for i in p_headers)
+                    rows.extend(p_rows)
+
+            # --- FASE 2: TULIS XLSX ---
+            if len(rows) > FAST_XLSX_ROW_THRESHOLD:
+                # Sheet raksasa: emisi XML langsung, tanpa objek Cell openpyxl
+                _write_xlsx_fast(rows, tmp_xlsx_path)
+            else:
+                # Workbook write-only: baris langsung di-stream ke XML, tanpa menahan
+                # seluruh objek Cell di memori (memori ~konstan berapapun jumlah halaman)
+                wb = Workbook(write_only=True)
+                ws = wb.create_sheet("Hasil Konversi")
+
+                # Auto-width: satu pass di atas list nilai mentah. Di mode write-only
+                # dimensi kolom wajib di-set sebelum baris pertama di-append
+                col_widths = {}
+                for row in rows:
+                    for c_idx, val in enumerate(row, 1):
+                        if val:
+                            width = len(str(val))
+                            if width > col_widths.get(c_idx, 0): col_widths[c_idx] = width
+                for c_idx, width in col_widths.items():
+                    ws.column_dimensions[get_column_letter(c_idx)].width = min(width + 2, 60)
+
+                for r_idx, row in enumerate(rows):
+                    if r_idx in table_rows:
+                        is_header = r_idx in header_rows
+                        styled = []
+                        for val in row:
+                            c = WriteOnlyCell(ws, value=val)
+                            c.border = THIN_BORDER
+                            if is_header:
+                                c.font = HEADER_FONT
+                                c.fill = HEADER_FILL
+                                c.alignment = ALIGN_HEADER
+                            else:
+                                c.alignment = ALIGN_BODY
+                            styled.append(c)
+                        ws.append(styled)
+                    else:
+                        ws.append(row)
+                wb.save(tmp_xlsx_path)
+
+        # Parsing + penulisan sama-sama CPU-bound -> offload ke threadpool
+        await run_in_threadpool(_convert)
+
+        cache_put(cache_key, tmp_xlsx_path)
         background_tasks.add_task(cleanup_folder, tmp_dir)
-        return FileResponse(path=tmp_xlsx_path, filename=xlsx_filename, media_type='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet')
+        return file_response(tmp_xlsx_path, xlsx_filename, 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet')
+    except HTTPException:
+        # Error client (413/400) diteruskan apa adanya, jangan dibungkus jadi 500
+        cleanup_folder(tmp_dir)
+        raise
     except Exception as e:
         cleanup_folder(tmp_dir)
         # Fallback simple jika logic kompleks error (agar tidak 500 terus)
-        logging.error(f"Excel error: {e}")
+        logging.error("Excel error: %s", e)
         raise HTTPException(status_code=500, detail="Gagal convert Excel. Pastikan file tidak corrupt.")
 
-# Helper function untuk excel rows (pengganti utils pandas)
-def dataframe_to_rows(df, index=False, header=False):
-    if header: yield df.columns.tolist()
-    for row in df.itertuples(index=index, name=None): yield row
-
 # ... [FITUR PDF TO PPT - V5.0 Ultimate] ...
+# Ukuran font dan warna span berulang terus dalam satu dokumen (biasanya cuma
+# segelintir nilai unik), jadi objek Pt/RGBColor-nya di-memo per nilai
+_pt_cache = {}
+_rgb_cache = {}
+
+def _pt(size):
+    key = round(size, 1)
+    pt = _pt_cache.get(key)
+    if pt is None:
+        pt = _pt_cache[key] = Pt(key)
+    return pt
+
+def _rgb(c):
+    rgb = _rgb_cache.get(c)
+    if rgb is None:
+        rgb = _rgb_cache[c] = RGBColor((c>>16)&0xFF, (c>>8)&0xFF, c&0xFF)
+    return rgb
+
+def _extract_ppt_blocks(pdf_path: str, page_idx: int):
+    """Worker pool proses: parse satu halaman menjadi daftar block picklable.
+
+    extractDICT() sudah mengembalikan dict murni (termasuk bytes gambar), jadi
+    hasilnya bisa langsung dikirim balik lintas proses tanpa konversi tambahan.
+    """
+    doc = fitz.open(pdf_path)
+    page = doc.load_page(page_idx)
+    # Satu TextPage dipakai untuk gambar sekaligus teks -> PDF hanya diparse sekali,
+    # bukan dua kali lewat get_text() terpisah
+    tp = page.get_textpage(flags=fitz.TEXT_PRESERVE_WHITESPACE | fitz.TEXT_PRESERVE_IMAGES)
+    blocks = tp.extractDICT()["blocks"]
+    doc.close()
+    return blocks
+
 @app.post("/convert/pdf-to-ppt")
-def convert_pdf_to_ppt(background_tasks: BackgroundTasks, file: UploadFile = File(...)):
+async def convert_pdf_to_ppt(background_tasks: BackgroundTasks, file: UploadFile = File(...)):
     validate_file(file)
-    tmp_dir = tempfile.mkdtemp()
-    tmp_pdf_path = os.path.join(tmp_dir, file.filename)
+    tmp_dir = make_tmp_dir()
     ppt_filename = os.path.splitext(file.filename)[0] + ".pptx"
     tmp_ppt_path = os.path.join(tmp_dir, ppt_filename)
     try:
-        with open(tmp_pdf_path, "wb") as buffer:
-            shutil.copyfileobj(file.file, buffer)
-        prs = Presentation()
-        doc = fitz.open(tmp_pdf_path)
-        if len(doc) > 0:
-            p1 = doc[0]
-            prs.slide_width = int((p1.rect.width / 72) * 914400)
-            prs.slide_height = int((p1.rect.height / 72) * 914400)
-        
-        for page in doc:
-            slide = prs.slides.add_slide(prs.slide_layouts[6])
-            # Images
-            img_blocks = [b for b in page.get_text("dict", flags=fitz.TEXT_PRESERVE_IMAGES)["blocks"] if b['type']==1]
-            for b in img_blocks:
-                img_path = os.path.join(tmp_dir, f"img_{os.urandom(4).hex()}.{b['ext']}")
-                with open(img_path, "wb") as f: f.write(b["image"])
-                x0,y0,x1,y1 = b["bbox"]
-                try: slide.shapes.add_picture(img_path, Inches(x0/72), Inches(y0/72), width=Inches((x1-x0)/72), height=Inches((y1-y0)/72))
-                except: pass
-            
-            # Text
-            text_blocks = [b for b in page.get_text("dict")["blocks"] if b['type']==0]
-            for b in text_blocks:
-                for line in b["lines"]:
-                    lx0,ly0,lx1,ly1 = line["bbox"]
-                    txBox = slide.shapes.add_textbox(Inches(lx0/72), Inches(ly0/72), Inches((lx1-lx0)/72), Inches((ly1-ly0)/72))
-                    tf = txBox.text_frame
-                    tf.word_wrap = False
-                    tf.auto_size = MSO_AUTO_SIZE.SHAPE_TO_FIT_TEXT
-                    tf.margin_left = tf.margin_right = tf.margin_top = tf.margin_bottom = 0
-                    p = tf.paragraphs[0]
-                    for span in line["spans"]:
-                        if not span["text"].strip(): continue
-                        run = p.add_run()
-                        run.text = span["text"]
-                        run.font.size = Pt(span["size"])
-                        try:
-                            c = span["color"]
-                            run.font.color.rgb = RGBColor((c>>16)&0xFF, (c>>8)&0xFF, c&0xFF)
+        pdf_bytes = await read_upload(file)
+
+        cache_key = f"{hashlib.sha256(pdf_bytes).hexdigest()}.pptx"
+        cached = cache_get(cache_key, tmp_dir)
+        if cached:
+            background_tasks.add_task(cleanup_folder, tmp_dir)
+            return file_response(cached, ppt_filename, 'application/vnd.openxmlformats-officedocument.presentationml.presentation')
+
+        def _build():
+            prs = Presentation()
+            # Worker membuka ulang dari path, jadi input ditaruh di disk sekali
+            tmp_pdf_path = os.path.join(tmp_dir, "input.pdf")
+            with open(tmp_pdf_path, "wb") as f:
+                f.write(pdf_bytes)
+            with fitz.open(tmp_pdf_path) as probe:
+                page_count = probe.page_count
+                if page_count > 0:
+                    p1 = probe[0]
+                    prs.slide_width = int(p1.rect.width * EMU_PER_POINT)
+                    prs.slide_height = int(p1.rect.height * EMU_PER_POINT)
+            # probe ditutup sebelum fork (dokumen fitz tidak fork-safe)
+
+            blank_layout = prs.slide_layouts[6]  # di-cache, tidak lookup per slide
+            # Parsing halaman berjalan paralel di pool; perakitan slide tetap
+            # berurutan di sini karena python-pptx tidak thread-safe
+            workers = min(os.cpu_count() or 1, 4)
+            with ProcessPoolExecutor(max_workers=workers) as ex:
+                page_payloads = ex.map(partial(_extract_ppt_blocks, tmp_pdf_path), range(page_count))
+                for blocks in page_payloads:
+                    slide = prs.slides.add_slide(blank_layout)
+                    # Images
+                    img_blocks = [b for b in blocks if b['type']==1]
+                    for b in img_blocks:
+                        # add_picture menerima file-like; bytes dari worker langsung
+                        # dipakai tanpa mampir ke file temp
+                        x0,y0,x1,y1 = b["bbox"]
+                        try: slide.shapes.add_picture(io.BytesIO(b["image"]), int(x0*EMU_PER_POINT), int(y0*EMU_PER_POINT), width=int((x1-x0)*EMU_PER_POINT), height=int((y1-y0)*EMU_PER_POINT))
                         except: pass
-                        if span["flags"] & 16: run.font.bold = True
-                        if span["flags"] & 2: run.font.italic = True
-        doc.close()
-        prs.save(tmp_ppt_path)
+            
+                    # Text: satu textbox per block (bukan per baris) -> jauh lebih
+                    # sedikit shape XML; tiap baris jadi satu paragraph di dalamnya
+                    text_blocks = [b for b in blocks if b['type']==0]
+                    for b in text_blocks:
+                        # Block yang seluruhnya whitespace tidak perlu diproses sama sekali
+                        if not any(s["text"].strip() for line in b["lines"] for s in line["spans"]): continue
+                        bx0,by0,bx1,by1 = b["bbox"]
+                        txBox = slide.shapes.add_textbox(int(bx0*EMU_PER_POINT), int(by0*EMU_PER_POINT), int((bx1-bx0)*EMU_PER_POINT), int((by1-by0)*EMU_PER_POINT))
+                        tf = txBox.text_frame
+                        tf.word_wrap = False
+                        # NONE: ukuran box sudah dari bbox PDF, tidak perlu auto-fit ulang (lebih cepat)
+                        tf.auto_size = MSO_AUTO_SIZE.NONE
+                        tf.margin_left = tf.margin_right = tf.margin_top = tf.margin_bottom = 0
+                        p = None
+                        for line in b["lines"]:
+                            # Skip baris kosong agar tidak membuat paragraph sia-sia
+                            if not any(s["text"].strip() for s in line["spans"]): continue
+                            p = tf.paragraphs[0] if p is None else tf.add_paragraph()
+                            # Span bertetangga dengan style sama digabung jadi satu run;
+                            # PDF sering memecah kalimat jadi banyak span identik
+                            prev_key = None
+                            run = None
+                            for span in line["spans"]:
+                                if not span["text"].strip(): continue
+                                key = (round(span["size"], 1), span["color"], span["flags"])
+                                if key == prev_key:
+                                    run.text += span["text"]
+                                    continue
+                                prev_key = key
+                                run = p.add_run()
+                                run.text = span["text"]
+                                run.font.size = _pt(span["size"])
+                                # color dari extractDICT selalu int sRGB -> tidak perlu try/except
+                                run.font.color.rgb = _rgb(span["color"])
+                                flags = span["flags"]
+                                if flags & 16: run.font.bold = True
+                                if flags & 2: run.font.italic = True
+            prs.save(tmp_ppt_path)
+
+        await run_in_threadpool(_build)
+        cache_put(cache_key, tmp_ppt_path)
         background_tasks.add_task(cleanup_folder, tmp_dir)
-        return FileResponse(path=tmp_ppt_path, filename=ppt_filename, media_type='application/vnd.openxmlformats-officedocument.presentationml.presentation')
+        return file_response(tmp_ppt_path, ppt_filename, 'application/vnd.openxmlformats-officedocument.presentationml.presentation')
+    except HTTPException:
+        # Error client (413/400) diteruskan apa adanya, jangan dibungkus jadi 500
+        cleanup_folder(tmp_dir)
+        raise
     except Exception as e:
         cleanup_folder(tmp_dir)
         raise HTTPException(status_code=500, detail=f"Gagal convert PPT: {str(e)}")
 
 # ... [FITUR PDF TO IMAGE] ...
+def _rasterize_page_jpeg(pdf_path: str, page_num: int, dpi: int) -> bytes:
+    """Worker pool proses untuk compress-pdf: render satu halaman jadi JPEG q70."""
+    doc = fitz.open(pdf_path)
+    pix = doc.load_page(page_num).get_pixmap(dpi=dpi)
+    # Encoder JPEG bawaan MuPDF: tanpa round-trip PIL dan tanpa pass Huffman
+    # kedua ala optimize=True yang ~2x lebih lambat demi beberapa persen byte
+    data = pix.tobytes(output="jpg", jpg_quality=70)
+    doc.close()
+    return data
+
+def _render_page(pdf_path: str, page_num: int, output_format: str = "png", dpi: int = 200, grayscale: bool = False) -> bytes:
+    """Worker pool proses: render satu halaman jadi bytes gambar ter-encode.
+    Tiap worker membuka dokumennya sendiri (fitz.Document tidak fork-safe)."""
+    doc = fitz.open(pdf_path)
+    fmt = "jpg" if output_format.lower() in ['jpg','jpeg'] else output_format
+    # Grayscale memangkas buffer pixmap 3x untuk dokumen scan hitam-putih
+    cs = fitz.csGRAY if grayscale else fitz.csRGB
+    pix = doc.load_page(page_num).get_pixmap(dpi=dpi, colorspace=cs, alpha=False)
+    if fmt == "jpg":
+        data = pix.tobytes(output=fmt, jpg_quality=85)
+    else:
+        data = pix.tobytes(output=fmt)
+    doc.close()
+    return data
+
 @app.post("/convert/pdf-to-image")
-def convert_pdf_to_image(background_tasks: BackgroundTasks, file: UploadFile = File(...), output_format: str = "png"):
+async def convert_pdf_to_image(background_tasks: BackgroundTasks, file: UploadFile = File(...), output_format: str = "png", grayscale: bool = False):
     validate_file(file)
-    tmp_dir = tempfile.mkdtemp()
-    tmp_pdf_path = os.path.join(tmp_dir, file.filename)
+    tmp_dir = make_tmp_dir()
     zip_filename = os.path.splitext(file.filename)[0] + "_images.zip"
     tmp_zip_path = os.path.join(tmp_dir, zip_filename)
     try:
-        with open(tmp_pdf_path, "wb") as buffer:
-            shutil.copyfileobj(file.file, buffer)
-        doc = fitz.open(tmp_pdf_path)
-        with ZipFile(tmp_zip_path, 'w') as zipf:
-            for i, page in enumerate(doc):
-                pix = page.get_pixmap(dpi=200)
-                img_name = f"page_{i+1}.{output_format}"
-                img_path = os.path.join(tmp_dir, img_name)
-                pix.save(img_path, output="jpg" if output_format.lower() in ['jpg','jpeg'] else output_format)
-                zipf.write(img_path, img_name)
-        doc.close()
+        pdf_bytes = await read_upload(file)
+
+        # Format ikut di key karena output zip-nya berbeda per format
+        gray_tag = "_gray" if grayscale else ""
+        cache_key = f"{hashlib.sha256(pdf_bytes).hexdigest()}_{output_format.lower()}{gray_tag}.zip"
+        cached = cache_get(cache_key, tmp_dir)
+        if cached:
+            background_tasks.add_task(cleanup_folder, tmp_dir)
+            return file_response(cached, zip_filename, 'application/zip')
+
+        def _render():
+            # Worker membuka ulang dari path, jadi input ditaruh di disk sekali
+            tmp_pdf_path = os.path.join(tmp_dir, "input.pdf")
+            with open(tmp_pdf_path, "wb") as f:
+                f.write(pdf_bytes)
+            doc = fitz.open(tmp_pdf_path)
+            page_count = len(doc)
+            doc.close()  # tutup sebelum fork, fitz.Document tidak fork-safe
+
+            workers = min(os.cpu_count() or 1, 4)
+            # PNG/JPG sudah terkompres -> deflate ulang cuma buang CPU, pakai STORED
+            with ZipFile(tmp_zip_path, 'w', ZIP_STORED) as zipf:
+                # Render paralel lintas core; penulisan ZIP tetap serial di sini
+                with ProcessPoolExecutor(max_workers=workers) as ex:
+                    render = partial(_render_page, tmp_pdf_path, output_format=output_format, grayscale=grayscale)
+                    for i, data in enumerate(ex.map(render, range(page_count))):
+                        zipf.writestr(f"page_{i+1}.{output_format}", data)
+
+        await run_in_threadpool(_render)
+        cache_put(cache_key, tmp_zip_path)
         background_tasks.add_task(cleanup_folder, tmp_dir)
-        return FileResponse(path=tmp_zip_path, filename=zip_filename, media_type='application/zip')
+        return file_response(tmp_zip_path, zip_filename, 'application/zip')
+    except HTTPException:
+        # Error client (413/400) diteruskan apa adanya, jangan dibungkus jadi 500
+        cleanup_folder(tmp_dir)
+        raise
     except Exception as e:
         cleanup_folder(tmp_dir)
         raise HTTPException(status_code=500, detail=f"Gagal convert Image: {str(e)}")
@@ -253,72 +771,96 @@ def convert_pdf_to_image(background_tasks: BackgroundTasks, file: UploadFile = F
 
 # === FITUR 5: GABUNGKAN PDF (MERGE) ===
 @app.post("/tools/merge-pdf")
-def merge_pdf(background_tasks: BackgroundTasks, files: List[UploadFile] = File(...)):
+async def merge_pdf(background_tasks: BackgroundTasks, files: List[UploadFile] = File(...)):
     if len(files) < 2:
         raise HTTPException(status_code=400, detail="Minimal upload 2 file PDF.")
     
-    tmp_dir = tempfile.mkdtemp()
+    tmp_dir = make_tmp_dir()
     merged_filename = "merged_document.pdf"
     tmp_merged_path = os.path.join(tmp_dir, merged_filename)
 
     try:
-        merged_doc = fitz.open()
-        for file in files:
-            if not file.filename.lower().endswith(".pdf"): continue
-            file_path = os.path.join(tmp_dir, file.filename)
-            with open(file_path, "wb") as f:
-                shutil.copyfileobj(file.file, f)
-            doc = fitz.open(file_path)
-            merged_doc.insert_pdf(doc)
-            doc.close()
-        
-        merged_doc.save(tmp_merged_path)
-        merged_doc.close()
+        # Upload dibaca async (non-blocking); hanya file .pdf yang diikutkan
+        inputs = [await read_upload(f) for f in files if f.filename.lower().endswith(".pdf")]
+
+        def _merge():
+            merged_doc = fitz.open()
+            # Parse input N+1 (fitz melepas GIL) berjalan overlap dengan
+            # insert_pdf input N; insert tetap serial karena penulisan
+            # dokumen MuPDF tidak thread-safe
+            with ThreadPoolExecutor(max_workers=min(len(inputs), 4) or 1) as ex:
+                futures = [ex.submit(fitz.open, stream=b, filetype="pdf") for b in inputs]
+                for fut in futures:
+                    doc = fut.result()
+                    merged_doc.insert_pdf(doc)
+                    doc.close()
+            # Opsi save yang sama dengan endpoint compress: hasil merge tanpa
+            # garbage-collect objek duplikat bisa membengkak drastis
+            merged_doc.save(tmp_merged_path, garbage=4, deflate=True, clean=True)
+            merged_doc.close()
+
+        # Kerja fitz berat dijalankan di threadpool agar event loop tetap bebas
+        await run_in_threadpool(_merge)
         background_tasks.add_task(cleanup_folder, tmp_dir)
-        return FileResponse(path=tmp_merged_path, filename=merged_filename, media_type='application/pdf')
+        return file_response(tmp_merged_path, merged_filename, 'application/pdf')
+    except HTTPException:
+        # Error client (413/400) diteruskan apa adanya, jangan dibungkus jadi 500
+        cleanup_folder(tmp_dir)
+        raise
     except Exception as e:
         cleanup_folder(tmp_dir)
         raise HTTPException(status_code=500, detail=f"Gagal Merge: {str(e)}")
 
 # === FITUR 6: PISAHKAN PDF (SPLIT) ===
 @app.post("/tools/split-pdf")
-def split_pdf(background_tasks: BackgroundTasks, pages: str = Form(...), file: UploadFile = File(...)):
+async def split_pdf(background_tasks: BackgroundTasks, pages: str = Form(...), file: UploadFile = File(...)):
     validate_file(file)
-    tmp_dir = tempfile.mkdtemp()
-    tmp_pdf_path = os.path.join(tmp_dir, file.filename)
+    tmp_dir = make_tmp_dir()
     split_filename = f"split_{file.filename}"
     tmp_split_path = os.path.join(tmp_dir, split_filename)
 
     try:
-        with open(tmp_pdf_path, "wb") as buffer:
-            shutil.copyfileobj(file.file, buffer)
-        
-        src_doc = fitz.open(tmp_pdf_path)
-        new_doc = fitz.open()
-        
-        # Parse range "1,3,5-7"
+        pdf_bytes = await read_upload(file)
+
+        # Parse range "1,3,5-7"; regex ketat menolak token rusak macam "1--3"
+        # atau "1,,3" yang dulu lolos diam-diam
         selected_indices = []
-        try:
-            for part in pages.split(','):
-                if '-' in part:
-                    s, e = map(int, part.split('-'))
-                    selected_indices.extend(range(s-1, e))
-                else:
-                    selected_indices.append(int(part)-1)
-        except:
-            raise HTTPException(status_code=400, detail="Format halaman salah. Contoh: 1,3,5-10")
-        
-        for idx in selected_indices:
-            if 0 <= idx < len(src_doc):
-                new_doc.insert_pdf(src_doc, from_page=idx, to_page=idx)
-        
-        if len(new_doc) == 0:
-            raise HTTPException(status_code=400, detail="Halaman tidak ditemukan/kosong.")
+        for part in pages.split(','):
+            m = _PAGE_RANGE_RE.match(part)
+            if not m:
+                raise HTTPException(status_code=400, detail="Format halaman salah. Contoh: 1,3,5-10")
+            s = int(m[1])
+            e = int(m[2]) if m[2] else s
+            selected_indices.extend(range(s-1, e))
+
+        def _split():
+            src_doc = fitz.open(stream=pdf_bytes, filetype="pdf")
+            new_doc = fitz.open()
+            valid = [idx for idx in selected_indices if 0 <= idx < len(src_doc)]
+            # Halaman berurutan digabung jadi satu insert_pdf per run: tiap
+            # panggilan mem-parse ulang xref sumber, jadi range "5-500" jauh
+            # lebih murah sebagai satu copy daripada 496 copy per halaman
+            i = 0
+            while i < len(valid):
+                j = i
+                while j + 1 < len(valid) and valid[j + 1] == valid[j] + 1:
+                    j += 1
+                new_doc.insert_pdf(src_doc, from_page=valid[i], to_page=valid[j])
+                i = j + 1
 
-        new_doc.save(tmp_split_path)
-        src_doc.close(); new_doc.close()
+            if len(new_doc) == 0:
+                raise HTTPException(status_code=400, detail="Halaman tidak ditemukan/kosong.")
+
+            new_doc.save(tmp_split_path, garbage=4, deflate=True, clean=True)
+            src_doc.close(); new_doc.close()
+
+        await run_in_threadpool(_split)
         background_tasks.add_task(cleanup_folder, tmp_dir)
-        return FileResponse(path=tmp_split_path, filename=split_filename, media_type='application/pdf')
+        return file_response(tmp_split_path, split_filename, 'application/pdf')
+    except HTTPException:
+        # Error client (413/400) diteruskan apa adanya, jangan dibungkus jadi 500
+        cleanup_folder(tmp_dir)
+        raise
     except Exception as e:
         cleanup_folder(tmp_dir)
         raise HTTPException(status_code=500, detail=f"Gagal Split: {str(e)}")
@@ -329,86 +871,112 @@ class CompressionType(str, Enum):
     TARGET = "target"
 
 @app.post("/tools/compress-pdf")
-def compress_pdf(
+async def compress_pdf(
     background_tasks: BackgroundTasks,
     file: UploadFile = File(...),
     compression_type: CompressionType = Form(CompressionType.RECOMMENDED),
     target_size_kb: Optional[int] = Form(None)
 ):
     validate_file(file)
-    tmp_dir = tempfile.mkdtemp()
-    tmp_pdf_path = os.path.join(tmp_dir, file.filename)
+    tmp_dir = make_tmp_dir()
     comp_filename = f"compressed_{file.filename}"
     tmp_comp_path = os.path.join(tmp_dir, comp_filename)
 
     try:
-        with open(tmp_pdf_path, "wb") as buffer:
-            shutil.copyfileobj(file.file, buffer)
+        pdf_bytes = await read_upload(file)
 
         # Ukuran Awal
-        original_size = os.path.getsize(tmp_pdf_path)
-        logging.info(f"Original size: {original_size} bytes")
-
-        doc = fitz.open(tmp_pdf_path)
-
-        # LOGIKA 1: KOMPRESI REKOMENDASI (Standard Deflate)
-        if compression_type == CompressionType.RECOMMENDED:
-            doc.save(
-                tmp_comp_path,
-                garbage=4,  # Hapus unused objects
-                deflate=True, # Kompres stream
-                clean=True
-            )
+        original_size = len(pdf_bytes)
+        logging.info("Original size: %s bytes", original_size)
+
+        def _compress():
+            # Input ditaruh di disk sekali supaya worker pool bisa buka sendiri
+            tmp_input = os.path.join(tmp_dir, "input.pdf")
+            with open(tmp_input, "wb") as f:
+                f.write(pdf_bytes)
+            doc = fitz.open(tmp_input)
+
+            # LOGIKA 1: KOMPRESI REKOMENDASI (Standard Deflate)
+            if compression_type == CompressionType.RECOMMENDED:
+                doc.save(
+                    tmp_comp_path,
+                    garbage=4,  # Hapus unused objects
+                    deflate=True, # Kompres stream
+                    clean=True
+                )
         
-        # LOGIKA 2: KOMPRESI TARGET SIZE (Best Effort)
-        elif compression_type == CompressionType.TARGET and target_size_kb:
-            target_bytes = target_size_kb * 1024
+            # LOGIKA 2: KOMPRESI TARGET SIZE (Best Effort)
+            elif compression_type == CompressionType.TARGET and target_size_kb:
+                target_bytes = target_size_kb * 1024
             
-            # Tahap 1: Coba kompresi standar dulu
-            doc.save(tmp_comp_path, garbage=4, deflate=True)
-            current_size = os.path.getsize(tmp_comp_path)
+                # Tahap 1: Coba kompresi standar dulu
+                doc.save(tmp_comp_path, garbage=4, deflate=True)
+                current_size = os.path.getsize(tmp_comp_path)
             
-            # Jika masih terlalu besar, lakukan Downsampling Gambar Agresif
-            if current_size > target_bytes:
-                logging.info("Standard compression not enough, starting aggressive downsampling...")
-                
-                # Kita coba 2 level: 96 DPI dan 72 DPI
-                for dpi_level in [96, 72, 50]: # Loop penurunan kualitas
-                    if current_size <= target_bytes:
-                        break # Sudah cukup
-                    
-                    # Buat PDF baru
-                    new_doc = fitz.open()
-                    
-                    # Render setiap halaman jadi gambar (Rasterize) lalu masukkan ke PDF baru
-                    # Ini cara paling ampuh mengecilkan ukuran file scan/foto
-                    for page in doc:
-                        pix = page.get_pixmap(dpi=dpi_level)
-                        # Kompresi gambar JPG
-                        img_bytes = pix.pil_tobytes(format="JPEG", quality=70, optimize=True)
-                        
-                        img_page = new_doc.new_page(width=page.rect.width, height=page.rect.height)
-                        img_page.insert_image(page.rect, stream=img_bytes)
-                    
-                    new_doc.save(tmp_comp_path, garbage=4, deflate=True)
-                    new_doc.close()
+                # Jika masih terlalu besar, lakukan Downsampling Gambar Agresif
+                if current_size > target_bytes:
+                    logging.info("Standard compression not enough, starting aggressive downsampling...")
+
+                    # Ukuran halaman dicatat dulu, lalu dokumen ditutup
+                    # sebelum pool fork (dokumen fitz tidak fork-safe)
+                    page_sizes = [(p.rect.width, p.rect.height) for p in doc]
+                    doc.close()
+                    doc = None
+                    workers = min(os.cpu_count() or 1, 4)
+
+                    # Model ukuran: bytes JPEG ~ k * luas(inch^2) * dpi^2.
+                    # k dikalibrasi dari satu halaman contoh di 96 DPI, lalu DPI
+                    # target dihitung sekali — bukan tangga 96->72->50 yang
+                    # merender penuh di tiap langkah
+                    total_area = sum(w * h for w, h in page_sizes) / 5184.0  # 72^2
+                    w0, h0 = page_sizes[0]
+                    sample = _rasterize_page_jpeg(tmp_input, 0, 96)
+                    k = len(sample) / ((w0 * h0 / 5184.0) * 96 * 96)
+                    dpi_level = max(50, min(96, int((target_bytes / (k * total_area)) ** 0.5)))
+
+                    # Maksimal 2 percobaan: hasil model + satu koreksi bila meleset
+                    for _attempt in range(2):
+                        # Render setiap halaman jadi gambar (Rasterize) lalu masukkan ke PDF baru
+                        # Ini cara paling ampuh mengecilkan ukuran file scan/foto.
+                        # Render paralel lintas core; perakitan PDF tetap serial
+                        new_doc = fitz.open()
+                        with ProcessPoolExecutor(max_workers=workers) as ex:
+                            rasterize = partial(_rasterize_page_jpeg, tmp_input, dpi=dpi_level)
+                            for (w, h), img_bytes in zip(page_sizes, ex.map(rasterize, range(len(page_sizes)))):
+                                img_page = new_doc.new_page(width=w, height=h)
+                                img_page.insert_image(fitz.Rect(0, 0, w, h), stream=img_bytes)
+
+                        new_doc.save(tmp_comp_path, garbage=4, deflate=True)
+                        new_doc.close()
                     
-                    current_size = os.path.getsize(tmp_comp_path)
-                    logging.info(f"Tried DPI {dpi_level}, new size: {current_size}")
+                        current_size = os.path.getsize(tmp_comp_path)
+                        logging.info("Tried DPI %s, new size: %s", dpi_level, current_size)
+                        if current_size <= target_bytes or dpi_level <= 50:
+                            break
+                        # Koreksi proporsional terhadap seberapa jauh meleset
+                        dpi_level = max(50, int(dpi_level * (target_bytes / current_size) ** 0.5))
 
-        else:
-            # Fallback default
-            doc.save(tmp_comp_path, garbage=4, deflate=True)
+            else:
+                # Fallback default
+                doc.save(tmp_comp_path, garbage=4, deflate=True)
+
+            if doc is not None:
+                doc.close()
+
+        # Kompresi (apalagi downsampling agresif) CPU-bound -> offload ke threadpool
+        await run_in_threadpool(_compress)
 
-        doc.close()
-        
         final_size = os.path.getsize(tmp_comp_path)
-        logging.info(f"Final size: {final_size} bytes")
+        logging.info("Final size: %s bytes", final_size)
 
         background_tasks.add_task(cleanup_folder, tmp_dir)
-        return FileResponse(path=tmp_comp_path, filename=comp_filename, media_type='application/pdf')
+        return file_response(tmp_comp_path, comp_filename, 'application/pdf')
 
+    except HTTPException:
+        # Error client (413/400) diteruskan apa adanya, jangan dibungkus jadi 500
+        cleanup_folder(tmp_dir)
+        raise
     except Exception as e:
         cleanup_folder(tmp_dir)
-        logging.error(f"ERROR COMPRESS: {str(e)}")
+        logging.error("ERROR COMPRESS: %s", e)
         raise HTTPException(status_code=500, detail=f"Gagal kompres PDF: {str(e)}")